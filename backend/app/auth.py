@@ -1,15 +1,24 @@
-from passlib.context import CryptContext
+from argon2 import PasswordHasher, Type, extract_parameters
+from argon2.exceptions import InvalidHashError, VerificationError
+from argon2.low_level import ARGON2_VERSION
 from jose import jwt
+from cachetools import TTLCache
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from .database import get_db
+from .token_store import RefreshTokenStore
 from datetime import timedelta
-import secrets
+import bcrypt
+import hashlib
+from collections import namedtuple
+import threading
+import time
+import uuid
 import os
-import re
 
 # ✅ FIX: Load environment variables
 load_dotenv()
@@ -24,55 +33,161 @@ REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 if not SECRET_KEY:
     raise ValueError("JWT_SECRET not set in environment variables")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+refresh_token_store = RefreshTokenStore(
+    os.getenv("REDIS_URL"),
+    ttl=REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600,
+)
+
+# argon2id for new hashes; bcrypt ("$2b$...") is verified for existing rows.
+# Called directly rather than through a passlib CryptContext, which does
+# scheme detection and option parsing on every verify.
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", 19456))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", 1))
+ARGON2_TARGET_MS = float(os.getenv("ARGON2_TARGET_MS", 50))
+
+
+def _calibrate_time_cost(target_ms: float, max_time_cost: int = 16):
+    # Smallest time_cost (>= 2) whose hash takes at least target_ms on this
+    # CPU, so login cost is the same budget whatever the host is.
+    for time_cost in range(2, max_time_cost + 1):
+        hasher = PasswordHasher(
+            time_cost=time_cost,
+            memory_cost=ARGON2_MEMORY_COST,
+            parallelism=ARGON2_PARALLELISM,
+        )
+        start = time.perf_counter()
+        hasher.hash("calibration")
+        if (time.perf_counter() - start) * 1000 >= target_ms:
+            break
+    return time_cost
+
+
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST") or _calibrate_time_cost(ARGON2_TARGET_MS))
+
+password_hasher = PasswordHasher(
+    time_cost=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
 
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return password_hasher.hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
+    if hashed_password.startswith("$2"):
+        return bcrypt.checkpw(plain_password.encode(), hashed_password.encode())
+
+    try:
+        return password_hasher.verify(hashed_password, plain_password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def needs_rehash(hashed_password: str):
+    # bcrypt rows and argon2 hashes weaker than the current parameters are
+    # rewritten after a successful login. Only weaker: each worker
+    # calibrates its own time_cost, and a hash from a worker that landed
+    # one step higher must not be rewritten on every login elsewhere.
+    if hashed_password.startswith("$2"):
+        return True
+
+    try:
+        params = extract_parameters(hashed_password)
+    except InvalidHashError:
+        return True
+
+    return (
+        params.type is not Type.ID
+        or params.version < ARGON2_VERSION
+        or params.time_cost < password_hasher.time_cost
+        or params.memory_cost < password_hasher.memory_cost
+        or params.parallelism < password_hasher.parallelism
+    )
 
 
 def create_access_token(data: dict):
     to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    # exp is NumericDate (unix seconds) in the token either way
+    expire = int(time.time()) + ACCESS_TOKEN_EXPIRE_MINUTES * 60
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def create_refresh_token(username: str):
-    token = secrets.token_urlsafe(64)
+def create_refresh_token(username: str, user_id: int):
+    # Signed JWT; only its jti is kept server-side (refresh_token_store),
+    # so issuing and checking one needs no database round-trip. The user's
+    # id rides along for the refresh_tokens row.
+    jti = uuid.uuid4().hex
     expiry = datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
-    return token, expiry
+    token = jwt.encode(
+        {"sub": username, "uid": user_id, "jti": jti, "type": "refresh", "exp": expiry},
+        SECRET_KEY,
+        algorithm=ALGORITHM,
+    )
+    refresh_token_store.add(jti)
+    return token, jti, expiry
+
+
+def consume_refresh_token(token: str):
+    # Returns (username, user_id) and retires the token (rotation), or None
+    # if the token is invalid, expired, already used or revoked. user_id is
+    # None for tokens issued before it was added to the claims.
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except Exception:
+        return None
+
+    if payload.get("type") != "refresh" or not payload.get("sub"):
+        return None
+
+    if not refresh_token_store.consume(payload.get("jti")):
+        return None
+
+    return payload["sub"], payload.get("uid")
+
+
+_SPECIAL_CHARS = frozenset('!@#$%^&*(),.?":{}|<>')
 
 
 def check_password_strength(password: str):
     score = 0
     feedback = []
 
+    # One pass over the password instead of one regex scan per rule
+    has_upper = has_lower = has_digit = has_special = False
+    for c in password:
+        if "A" <= c <= "Z":
+            has_upper = True
+        elif "a" <= c <= "z":
+            has_lower = True
+        elif c.isdecimal():
+            has_digit = True
+        elif c in _SPECIAL_CHARS:
+            has_special = True
+
     if len(password) >= 8:
         score += 1
     else:
         feedback.append("Password must be at least 8 characters")
 
-    if re.search(r"[A-Z]", password):
+    if has_upper:
         score += 1
     else:
         feedback.append("Add at least one uppercase letter")
 
-    if re.search(r"[a-z]", password):
+    if has_lower:
         score += 1
     else:
         feedback.append("Add at least one lowercase letter")
 
-    if re.search(r"\d", password):
+    if has_digit:
         score += 1
     else:
         feedback.append("Add at least one number")
 
-    if re.search(r"[!@#$%^&*(),.?\":{}|<>]", password):
+    if has_special:
         score += 1
     else:
         feedback.append("Add at least one special character")
@@ -89,28 +204,97 @@ def check_password_strength(password: str):
 
 security = HTTPBearer()
 
+# Verified tokens: sha256(token) -> (username, exp). Skips the HMAC verify
+# and JSON parse for bearers reused within the TTL; exp is still enforced.
+_jwt_cache = TTLCache(maxsize=10_000, ttl=30)
+_jwt_cache_lock = threading.Lock()
+
 
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
+        key = hashlib.sha256(token.encode()).digest()
+
+        with _jwt_cache_lock:
+            cached = _jwt_cache.get(key)
+
+        if cached:
+            username, exp = cached
+            if exp > time.time():
+                return username
+
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
 
-        if username is None:
+        # Refresh tokens share the signing key; never accept one as access
+        if username is None or payload.get("type") == "refresh":
             raise HTTPException(status_code=401, detail="Invalid token")
 
+        with _jwt_cache_lock:
+            _jwt_cache[key] = (username, payload["exp"])
+
         return username
 
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
-def get_current_admin(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+# Login-path snapshot of a user row; cached by username for 30 s so repeat
+# logins skip the SELECT. Invalidate after any write to these columns.
+CachedUser = namedtuple(
+    "CachedUser",
+    ["id", "username", "password", "is_admin", "failed_attempts", "lockout_until", "ban_until"],
+)
+
+_user_cache = TTLCache(maxsize=10_000, ttl=30)
+_user_cache_lock = threading.RLock()
+
+
+def get_user_cached(username: str, db: Session):
     from .models import User
 
-    user = db.query(User).filter(User.username == current_user).first()
+    with _user_cache_lock:
+        cached = _user_cache.get(username)
+
+    if cached is not None:
+        return cached
+
+    # Only the snapshot's columns, as a plain row: no ORM entity or
+    # identity-map bookkeeping on the login path
+    row = db.execute(
+        select(
+            User.id,
+            User.username,
+            User.password,
+            User.is_admin,
+            User.failed_attempts,
+            User.lockout_until,
+            User.ban_until,
+        ).where(User.username == username)
+    ).first()
+    if row is None:
+        return None
+
+    cached = CachedUser(*row)
+
+    with _user_cache_lock:
+        _user_cache[username] = cached
+
+    return cached
+
+
+def invalidate_user_cache(username: str):
+    with _user_cache_lock:
+        _user_cache.pop(username, None)
+
+
+# Admin checks reuse the login snapshot cache: the token is decoded once per
+# request (FastAPI shares get_current_user between dependencies) and the
+# is_admin lookup is a dict hit for 30 s after the first one.
+def get_current_admin(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = get_user_cached(current_user, db)
 
     if not user or not user.is_admin:
         raise HTTPException(status_code=403, detail="Admin access required")
 
-    return user
\ No newline at end of file
+    return user
@@ -9,10 +9,26 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL not set in environment variables")
 
+# Pool sizing only applies to server databases; SQLite (local dev) picks
+# its own pool class, which rejects these options. Every worker process
+# has its own pool, so by default 20 + 10 connections are split across
+# WEB_CONCURRENCY workers; the database sees up to
+# workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+pool_options = {}
+if not DATABASE_URL.startswith("sqlite"):
+    pool_options = {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", max(2, 20 // WEB_CONCURRENCY))),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", max(1, 10 // WEB_CONCURRENCY))),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),  # seconds
+    }
+
 engine = create_engine(
     DATABASE_URL,
     # echo=False  #  FIX: Disable SQL logs for production safety
-     pool_pre_ping=True
+    pool_pre_ping=True,
+    **pool_options
 )
 
 SessionLocal = sessionmaker(
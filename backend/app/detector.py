@@ -1,22 +1,46 @@
-import json
+import hashlib
+import os
 import re
+import threading
 from collections import Counter
 from datetime import datetime, timedelta
 from datetime import timezone
+from functools import lru_cache
+from pathlib import Path
 
+import orjson
+from cachetools import TTLCache
+
+try:
+    import hyperscan
+except ImportError:  # fall back to the Aho-Corasick automaton
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:  # fall back to the stdlib regex engine
+    ahocorasick = None
+
+from fastapi import BackgroundTasks
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from app.models import Offense
-from .ml_engine import analyze_ml
+from .database import SessionLocal
+from .ml_engine import ML_MIN_LENGTH, batched_analyze_ml, unscored_result
 from .escalation import time_based_escalation, repeat_escalation
 
 
+_LONG_WORD_RE = re.compile(r"\b\w{15,}\b")
+
+TEXT_CACHE_SIZE = int(os.getenv("TEXT_CACHE_SIZE", 10_000))
+TEXT_CACHE_TTL = int(os.getenv("TEXT_CACHE_TTL", 600))  # seconds
+
 
 # -----------------------------
-# Trie-Based Toxic Detector
+# Multi-Pattern Toxic Detector
 # -----------------------------
 class AdvancedToxicDetector:
     def __init__(self):
-        self.root = {}
         self.language_counters = Counter()
         self._load_extended_keywords()
 
@@ -87,34 +111,118 @@ class AdvancedToxicDetector:
             ("nadie te necesita", "spanish", 3),
         ]
 
-        for word, language, severity in keywords:
-            self._add_to_trie(word, language, severity)
+        self._kw_meta = {word: (language, severity) for word, language, severity in keywords}
+
+        if hyperscan is not None:
+            self._hs_keywords = [
+                (word, language, severity)
+                for word, (language, severity) in self._kw_meta.items()
+            ]
+            self._hs_db = hyperscan.Database()
+            self._hs_db.compile(
+                expressions=[re.escape(word).encode() for word, _, _ in self._hs_keywords],
+                ids=list(range(len(self._hs_keywords))),
+                elements=len(self._hs_keywords),
+                flags=[hyperscan.HS_FLAG_CASELESS] * len(self._hs_keywords),
+            )
+            # Scratch space is not thread-safe; one per worker thread
+            self._hs_local = threading.local()
+        elif ahocorasick is not None:
+            self.automaton = ahocorasick.Automaton()
+            for word, (language, severity) in self._kw_meta.items():
+                self.automaton.add_word(word, (word, language, severity))
+
+            # Built once; every scan is a single linear pass in C
+            self.automaton.make_automaton()
+        else:
+            # Longest first so "idiota" wins over "idiot"; the lookahead
+            # keeps overlapping hits like "tum useless ho" / "useless"
+            alternation = "|".join(
+                re.escape(word) for word in sorted(self._kw_meta, key=len, reverse=True)
+            )
+            self._pattern = re.compile(f"(?=({alternation}))")
+
+            # ...and only the longest hit per offset is reported, so the
+            # shorter keywords it starts with ("idiot") are added back to
+            # match the other backends
+            self._kw_prefixes = {
+                word: [
+                    (shorter, *self._kw_meta[shorter])
+                    for shorter in sorted(self._kw_meta, key=len)
+                    if len(shorter) < len(word) and word.startswith(shorter)
+                ]
+                for word in self._kw_meta
+            }
+
+    def _fold(self, text):
+        # Hyperscan folds ASCII case itself, so ASCII messages skip the
+        # str.lower() copy and go straight to bytes; the rest (Hindi,
+        # Spanish accents) still need Unicode lowering first
+        if hyperscan is not None:
+            if text.isascii():
+                return text.encode()
+            return text.lower().encode()
 
-    def _add_to_trie(self, word, language, severity):
-        node = self.root
-        for char in word:
-            node = node.setdefault(char, {})
-        node["#"] = (language, severity)
+        return text.lower()
 
     def _search_trie(self, text):
-        results = []
-        for i in range(len(text)):
-            node = self.root
-            j = i
-            matched = []
-
-            while j < len(text) and text[j] in node:
-                matched.append(text[j])
-                node = node[text[j]]
-                j += 1
-
-                if "#" in node:
-                    language, severity = node["#"]
-                    self.language_counters[language] += 1
-                    results.append(("".join(matched), language, severity))
-
+        if hyperscan is not None:
+            if isinstance(text, str):
+                text = text.encode()
+
+            results = []
+            self._hs_db.scan(
+                text,
+                match_event_handler=self._on_hs_match,
+                context=results,
+                scratch=self._hs_scratch(),
+            )
+        elif ahocorasick is not None:
+            results = [match for _, match in self.automaton.iter(text)]
+        else:
+            results = []
+            for m in self._pattern.finditer(text):
+                word = m.group(1)
+                results.extend(self._kw_prefixes[word])
+                results.append((word, *self._kw_meta[word]))
+        self.language_counters.update(language for _, language, _ in results)
         return results
 
+    def _hs_scratch(self):
+        scratch = getattr(self._hs_local, "scratch", None)
+        if scratch is None:
+            scratch = self._hs_local.scratch = hyperscan.Scratch(self._hs_db)
+        return scratch
+
+    def _on_hs_match(self, keyword_id, start, end, flags, results):
+        results.append(self._hs_keywords[keyword_id])
+
+
+# -----------------------------
+# Config (read once at import)
+# -----------------------------
+def _load_config_once():
+    try:
+        return orjson.loads(Path("config.json").read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return {
+            "severity_thresholds": {
+                "clean": 0,
+                "mild": 1,
+                "moderate": 5,
+                "severe": 10
+            },
+            "response_actions": {
+                "clean": "allow",
+                "mild": "warning",
+                "moderate": "temporary_suspension",
+                "severe": "permanent_ban",
+            },
+        }
+
+
+_CONFIG = _load_config_once()
+
 
 # -----------------------------
 # Cyberbullying System
@@ -122,27 +230,11 @@ class AdvancedToxicDetector:
 class CyberbullyingSystem:
     def __init__(self):
         self.detector = AdvancedToxicDetector()
-        self._load_config()
-
-    def _load_config(self):
-        try:
-            with open("config.json") as f:
-                self.config = json.load(f)
-        except:
-            self.config = {
-               "severity_thresholds": {
-               "clean": 0,
-               "mild": 1,
-               "moderate": 5,
-               "severe": 10
-        },
-        "response_actions": {
-            "clean": "allow",
-            "mild": "warning",
-            "moderate": "temporary_suspension",
-            "severe": "permanent_ban",
-        },
-    }
+        self.config = _CONFIG
+        # digest(text) -> analyze_text() result; repeated texts (forwards,
+        # spam templates) skip the scan. Text-only: never the per-user result.
+        self._text_cache = TTLCache(maxsize=TEXT_CACHE_SIZE, ttl=TEXT_CACHE_TTL)
+        self._text_cache_lock = threading.Lock()
 
     def _now(self):
         return datetime.now(timezone.utc)
@@ -150,9 +242,17 @@ class CyberbullyingSystem:
     # -----------------------------
     # MAIN ANALYSIS FUNCTION
     # -----------------------------
-    def analyze_message(self, text: str, user_id: str, db: Session):
+    def analyze_message(self, text: str, user_id: str, db: Session,
+                        background_tasks: BackgroundTasks = None):
 
-        if self._is_lockout(user_id, db):
+        now = self._now()
+
+        # One round-trip for the offense row; the helpers below share it
+        offense = db.execute(
+            select(Offense).where(Offense.user_id == user_id)
+        ).scalar_one_or_none()
+
+        if self._is_lockout(offense, now):
             return {
                 "risk_level": "locked_out",
                 "score": 0,
@@ -160,12 +260,9 @@ class CyberbullyingSystem:
                 "matched_terms": [],
             }
 
-        matches = self.detector._search_trie(text.lower())
-        base_score = sum(sev for _, _, sev in matches)
+        matches, base_score, context_score = self.analyze_text(text)
 
-        context_score = self._analyze_context(text)
-
-        user_score, rapid = self._check_user_history(user_id, db)
+        user_score, rapid = self._check_user_history(offense, now)
         if rapid:
             base_score += 2
 
@@ -174,7 +271,11 @@ class CyberbullyingSystem:
         thresholds = self.config["severity_thresholds"]
         action, risk_level = self._determine_action(total_score, thresholds)
 
-        self._update_user_profile(user_id, total_score, action, db)
+        if background_tasks is not None:
+            # Response goes out first; the offense write runs after it
+            background_tasks.add_task(self.record_offense, user_id, total_score, action, now)
+        else:
+            self._update_user_profile(offense, user_id, total_score, action, now, db)
 
         return {
             "risk_level": risk_level,
@@ -183,6 +284,29 @@ class CyberbullyingSystem:
             "matched_terms": [(term, lang) for term, lang, _ in matches],
         }
 
+    # -----------------------------
+    # Text-Only Scoring (no DB)
+    # -----------------------------
+    def analyze_text(self, text: str):
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+        with self._text_cache_lock:
+            cached = self._text_cache.get(key)
+
+        if cached is not None:
+            self.detector.language_counters.update(lang for _, lang, _ in cached[0])
+            return cached
+
+        matches = self.detector._search_trie(self.detector._fold(text))
+        base_score = sum(sev for _, _, sev in matches)
+        context_score = self._analyze_context(text)
+        result = (matches, base_score, context_score)
+
+        with self._text_cache_lock:
+            self._text_cache[key] = result
+
+        return result
+
     # -----------------------------
     # Context Analysis
     # -----------------------------
@@ -190,23 +314,22 @@ class CyberbullyingSystem:
         score = 0
         if text.isupper():
             score += 2
-        if any(c in text for c in "!?"):
-            score += 1
-        if len(re.findall(r"\b\w{15,}\b", text)) > 2:
+        if "!" in text or "?" in text:
             score += 1
+        # Only "more than two" matters; stop at the third long word
+        for count, _ in enumerate(_LONG_WORD_RE.finditer(text), 1):
+            if count > 2:
+                score += 1
+                break
         return score
 
     # -----------------------------
     # User History (PostgreSQL)
     # -----------------------------
-    def _check_user_history(self, user_id, db: Session):
-        offense = db.query(Offense).filter(Offense.user_id == user_id).first()
-
+    def _check_user_history(self, offense, now):
         if offense:
             if offense.last_offense:
-                time_diff = (
-                    self._now() - offense.last_offense
-                ).total_seconds()
+                time_diff = (now - offense.last_offense).total_seconds()
 
                 if time_diff < 600:
                     return min(offense.count * 2, 5), True
@@ -218,11 +341,9 @@ class CyberbullyingSystem:
     # -----------------------------
     # Lockout Check
     # -----------------------------
-    def _is_lockout(self, user_id, db: Session):
-        offense = db.query(Offense).filter(Offense.user_id == user_id).first()
-
+    def _is_lockout(self, offense, now):
         if offense and offense.lockout_until:
-            return self._now() < offense.lockout_until
+            return now < offense.lockout_until
 
         return False
 
@@ -242,35 +363,85 @@ class CyberbullyingSystem:
     # -----------------------------
     # Update Offense Record
     # -----------------------------
-    def _update_user_profile(self, user_id, score, action, db: Session):
+    def record_offense(self, user_id, score, action, now):
+        # Runs as a background task, after the request session is closed
+        db = SessionLocal()
+        try:
+            offense = db.execute(
+                select(Offense).where(Offense.user_id == user_id)
+            ).scalar_one_or_none()
+            self._update_user_profile(offense, user_id, score, action, now, db)
+        finally:
+            db.close()
 
-        offense = db.query(Offense).filter(Offense.user_id == user_id).first()
+    def _update_user_profile(self, offense, user_id, score, action, now, db: Session):
 
         lockout_until = None
         if action == "permanent_ban":
-            lockout_until = self._now() + timedelta(hours=48)
+            lockout_until = now + timedelta(hours=48)
 
         if offense:
             offense.count += 1
             offense.severity_score += score
-            offense.last_offense = self._now()
+            offense.last_offense = now
             offense.lockout_until = lockout_until
         else:
             offense = Offense(
                 user_id=user_id,
                 count=1,
                 severity_score=score,
-                last_offense=self._now(),
+                last_offense=now,
                 lockout_until=lockout_until,
             )
             db.add(offense)
 
         db.commit()
 
-def hybrid_detect(text: str, keyword_score: int, user_id: str):
+# Keyword index is read-only after construction; share one per process,
+# built on first use rather than at import
+@lru_cache(maxsize=None)
+def get_system():
+    return CyberbullyingSystem()
+
+
+# Any letter in any script; text without one (emoji, digits, punctuation)
+# gives the models nothing to classify
+_LETTER_RE = re.compile(r"[^\W\d_]")
+
+# Whole messages that are only a greeting / acknowledgement; the model is
+# not asked about these. Kept to fixed phrases: "short and plain" alone
+# would let through "you are worthless".
+_SAFE_RE = re.compile(
+    r"(?:(?:hi|hey|hello|good (?:morning|afternoon|evening|night)|ok(?:ay)?|yes|no|sure|"
+    r"thanks|thank you|thx|lol|haha|bye|see you|np|cool|nice|great)[\s.,!?]*)+",
+    re.IGNORECASE,
+)
+
+# A keyword_score of 5 or more gives keyword_score * 2 >= 10, already
+# "Severe" in classify(); with a non-zero keyword score the ML terms can
+# only add to that
+ML_SKIP_KEYWORD_SCORE = 5
 
-    # 1️⃣ ML Analysis
-    ml_score, categories, sentiment_label = analyze_ml(text)
+
+def _needs_ml(text: str, keyword_score: int):
+    if keyword_score >= ML_SKIP_KEYWORD_SCORE:
+        return False
+    stripped = text.strip()
+    return (
+        len(stripped) >= ML_MIN_LENGTH
+        and _LETTER_RE.search(stripped) is not None
+        and _SAFE_RE.fullmatch(stripped) is None
+    )
+
+
+async def hybrid_detect(text: str, keyword_score: int, user_id: str):
+
+    # 1️⃣ ML Analysis (coalesced with concurrent requests), skipped when it
+    # cannot change the outcome
+    if _needs_ml(text, keyword_score):
+        ml_score, categories, sentiment_label = await batched_analyze_ml(text)
+    else:
+        ml_score, categories, sentiment_label = unscored_result()
 
     # Normalize ML score (0–1 range → scale)
     ml_scaled = ml_score * 5
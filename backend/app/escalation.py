@@ -1,11 +1,27 @@
-from datetime import datetime, timedelta
+import threading
+import time
+from datetime import datetime
 
-# Store recent offenses in memory (lightweight, safe)
-user_recent_activity = {}
+from cachetools import TTLCache
+
+# Store recent offenses in memory (bounded; entries expire with the 10 min window)
+user_recent_activity = TTLCache(maxsize=100_000, ttl=600)
+_activity_lock = threading.Lock()
+
+# [hour, valid_until (monotonic)]; the hour is re-read at most once a minute
+_HOUR_CACHE = [0, 0.0]
+
+
+def _current_hour():
+    t = time.monotonic()
+    if t >= _HOUR_CACHE[1]:
+        _HOUR_CACHE[0] = datetime.now().hour
+        _HOUR_CACHE[1] = t + 60
+    return _HOUR_CACHE[0]
 
 
 def time_based_escalation(score):
-    current_hour = datetime.now().hour
+    current_hour = _current_hour()
 
     # 12 AM – 5 AM stricter
     if 0 <= current_hour < 5:
@@ -14,17 +30,21 @@ def time_based_escalation(score):
     return score
 
 
+REPEAT_WINDOW_SECONDS = 600
+
+
 def repeat_escalation(user_id: str, score):
-    now = datetime.now()
+    # Monotonic seconds: a float compare, unaffected by wall-clock changes
+    now = time.monotonic()
 
-    if user_id in user_recent_activity:
-        last_time = user_recent_activity[user_id]
+    with _activity_lock:
+        last_time = user_recent_activity.get(user_id)
 
-        # If repeated within 10 minutes → multiply
-        if now - last_time < timedelta(minutes=10):
-            score *= 1.5
+        # Update timestamp
+        user_recent_activity[user_id] = now
 
-    # Update timestamp
-    user_recent_activity[user_id] = now
+    # If repeated within 10 minutes → multiply
+    if last_time is not None and now - last_time < REPEAT_WINDOW_SECONDS:
+        score *= 1.5
 
     return score
\ No newline at end of file
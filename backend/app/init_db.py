@@ -0,0 +1,138 @@
+import re
+
+from sqlalchemy import Integer, inspect
+from sqlalchemy.schema import CreateIndex
+
+from .database import engine, Base
+from . import models  # noqa: F401  (registers the tables on Base.metadata)
+
+
+# -----------------------------
+# Create Tables
+# -----------------------------
+# Run once per deploy (see Procfile), not on every worker import:
+#   python -m app.init_db
+def init_db():
+    Base.metadata.create_all(bind=engine)
+    upgrade_audit_user_agents()
+    upgrade_audit_timestamp()
+    upgrade_refresh_token_user_id()
+    add_missing_server_defaults()
+    create_missing_indexes()
+
+
+# audit_logs.user_agent (full header per row) -> user_agent_id into the
+# user_agents dictionary. The old column is backfilled from, then left in
+# place (nullable, unused) rather than dropped.
+def upgrade_audit_user_agents():
+    columns = {column["name"] for column in inspect(engine).get_columns("audit_logs")}
+    if "user_agent_id" in columns:
+        return
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "ALTER TABLE audit_logs ADD COLUMN user_agent_id INTEGER REFERENCES user_agents (id)"
+        )
+        if "user_agent" in columns:
+            conn.exec_driver_sql(
+                "INSERT INTO user_agents (value) "
+                "SELECT DISTINCT user_agent FROM audit_logs WHERE user_agent IS NOT NULL"
+            )
+            conn.exec_driver_sql(
+                "UPDATE audit_logs SET user_agent_id = "
+                "(SELECT id FROM user_agents WHERE user_agents.value = audit_logs.user_agent)"
+            )
+
+
+# audit_logs.timestamp: naive UTC with a Python default -> timestamptz
+# filled in by the database. SQLite has no column types to change.
+def upgrade_audit_timestamp():
+    if engine.dialect.name != "postgresql":
+        return
+
+    columns = {column["name"]: column for column in inspect(engine).get_columns("audit_logs")}
+    if getattr(columns["timestamp"]["type"], "timezone", False):
+        return
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "ALTER TABLE audit_logs "
+            "ALTER COLUMN timestamp TYPE timestamptz USING timestamp AT TIME ZONE 'UTC', "
+            "ALTER COLUMN timestamp SET DEFAULT now()"
+        )
+
+
+# refresh_tokens.user_id: username string (FK users.username) -> integer
+# FK users.id, backfilled by username. Rows that match no user or have no
+# expiry are dropped; the table is an audit trail, token validity lives in
+# the refresh token store. SQLite keeps the old column (recreate it there).
+def upgrade_refresh_token_user_id():
+    if engine.dialect.name != "postgresql":
+        return
+
+    columns = {column["name"]: column for column in inspect(engine).get_columns("refresh_tokens")}
+    if isinstance(columns["user_id"]["type"], Integer):
+        return
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ALTER TABLE refresh_tokens ADD COLUMN user_id_new INTEGER")
+        conn.exec_driver_sql(
+            "UPDATE refresh_tokens SET user_id_new = users.id "
+            "FROM users WHERE users.username = refresh_tokens.user_id"
+        )
+        conn.exec_driver_sql(
+            "DELETE FROM refresh_tokens WHERE user_id_new IS NULL OR expires_at IS NULL"
+        )
+        conn.exec_driver_sql("ALTER TABLE refresh_tokens DROP COLUMN user_id")
+        conn.exec_driver_sql("ALTER TABLE refresh_tokens RENAME COLUMN user_id_new TO user_id")
+        conn.exec_driver_sql(
+            "ALTER TABLE refresh_tokens "
+            "ALTER COLUMN user_id SET NOT NULL, "
+            "ALTER COLUMN expires_at SET NOT NULL, "
+            "ADD FOREIGN KEY (user_id) REFERENCES users (id)"
+        )
+
+
+# Column defaults moved from Python (default=) to the database
+# (server_default=), so rows inserted without them must get the value from the
+# column itself. Tables created before the move have no DEFAULT; add it.
+# SQLite can't ALTER a column default -- recreate a dev database instead.
+def add_missing_server_defaults():
+    if engine.dialect.name != "postgresql":
+        return
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"]: column for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.server_default is None or column.name not in existing:
+                    continue
+                if existing[column.name]["default"] is not None:
+                    continue
+                default = column.server_default.arg.compile(dialect=conn.dialect)
+                conn.exec_driver_sql(
+                    f'ALTER TABLE {table.name} ALTER COLUMN "{column.name}" SET DEFAULT {default}'
+                )
+
+
+# create_all skips tables that already exist, so indexes added to the
+# models later are created here. On PostgreSQL they are built CONCURRENTLY
+# (outside a transaction) so a large audit_logs table isn't write-locked.
+_CREATE_INDEX_RE = re.compile(r"^CREATE (UNIQUE )?INDEX")
+
+
+def create_missing_indexes():
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        concurrently = conn.dialect.name == "postgresql"
+
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=conn.dialect))
+                if concurrently:
+                    ddl = _CREATE_INDEX_RE.sub(r"CREATE \1INDEX CONCURRENTLY", ddl, count=1)
+                conn.exec_driver_sql(ddl)
+
+
+if __name__ == "__main__":
+    init_db()
@@ -1,30 +1,55 @@
 import os
-from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from slowapi.middleware import SlowAPIMiddleware
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import datetime, timedelta
+from sqlalchemy import case, func, update
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+import orjson
 
-from .database import engine, SessionLocal, Base
-from .models import User, Case, Offense, RefreshToken, AuditLog
+from .database import SessionLocal
+from .models import User, Case, Offense, RefreshToken, AuditLog, UserAgent
 from .auth import (
     hash_password,
     verify_password,
+    needs_rehash,
     create_access_token,
     create_refresh_token,   # ✅ FIXED IMPORT
+    consume_refresh_token,
     check_password_strength,
     get_current_user,
-    get_current_admin
+    get_current_admin,
+    get_user_cached,
+    invalidate_user_cache
 )
-from .detector import CyberbullyingSystem
-from .schemas import MessageRequest
+from .detector import CyberbullyingSystem, get_system
+from .ml_engine import (
+    start_ml_batcher,
+    stop_ml_batcher,
+    start_ml_client,
+    close_ml_client,
+    load_local_model
+)
+from .schemas import (
+    MessageRequest,
+    MessageResponse,
+    LoginResponse,
+    RefreshResponse,
+    SummaryResponse,
+    UserPage,
+    OffensePage,
+    CasePage
+)
+from .middleware import BodySizeLimitMiddleware, SecurityHeadersMiddleware
 from .security_logger import logger
+from .write_buffer import WriteBuffer
+from .user_agents import resolve_user_agents
 
 # -----------------------------
 # Initialize App
@@ -40,10 +65,40 @@ FRONTEND_URL = os.getenv("FRONTEND_URL")
 if not FRONTEND_URL:
     raise ValueError("FRONTEND_URL environment variable not set")
 
+# -----------------------------
+# Detector Warm-up
+# -----------------------------
+# Build the keyword index before the first request instead of during it
+@app.on_event("startup")
+def build_detector():
+    get_system()
+
+
+# -----------------------------
+# ML Client + Micro-Batcher
+# -----------------------------
+@app.on_event("startup")
+async def start_ml_engine():
+    start_ml_client()
+    await load_local_model()  # no-op unless USE_LOCAL_MODEL=1
+    start_ml_batcher()
+
+
+@app.on_event("shutdown")
+async def stop_ml_engine():
+    await stop_ml_batcher()
+    await close_ml_client()
+
 # -----------------------------
 # Rate Limiter Setup
 # -----------------------------
-limiter = Limiter(key_func=get_remote_address)
+# Shared Redis store keeps limits global across workers; the moving window
+# avoids fixed-window boundary bursts. Falls back to per-process memory.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.getenv("REDIS_URL", "memory://"),
+    strategy="moving-window",
+)
 app.state.limiter = limiter
 app.add_middleware(SlowAPIMiddleware)
 
@@ -52,7 +107,7 @@ app.add_middleware(SlowAPIMiddleware)
 # -----------------------------
 @app.exception_handler(RateLimitExceeded)
 def rate_limit_handler(request: Request, exc: RateLimitExceeded):
-    logger.warning(f"Rate limit exceeded from {request.client.host} at {request.url}")
+    logger.warning("Rate limit exceeded from %s at %s", request.client.host, request.url)
     return JSONResponse(
         status_code=429,
         content={"detail": "Too many requests. Try again later."},
@@ -64,11 +119,11 @@ def rate_limit_handler(request: Request, exc: RateLimitExceeded):
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     if exc.status_code == 401:
-        logger.warning(f"Unauthorized access attempt at {request.url}")
+        logger.warning("Unauthorized access attempt at %s", request.url)
     elif exc.status_code == 403:
-        logger.warning(f"Forbidden access attempt at {request.url}")
+        logger.warning("Forbidden access attempt at %s", request.url)
     elif exc.status_code == 400:
-        logger.info(f"Bad request at {request.url}")
+        logger.info("Bad request at %s", request.url)
 
     return JSONResponse(
         status_code=exc.status_code,
@@ -80,7 +135,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 # -----------------------------
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled server error at {request.url}: {str(exc)}")
+    logger.error("Unhandled server error at %s: %s", request.url, exc)
     return JSONResponse(
         status_code=500,
         content={"detail": "Internal server error"},
@@ -98,74 +153,82 @@ app.add_middleware(
 )
 
 # -----------------------------
-# Security Headers
+# Payload Size Limit
 # -----------------------------
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response: Response = await call_next(request)
-
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-    response.headers["Content-Security-Policy"] = (
-        "default-src 'self'; "
-        "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-        "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
-        "img-src 'self' data: https://fastapi.tiangolo.com;"
-    )
-
-    return response
+app.add_middleware(BodySizeLimitMiddleware, max_size=1024 * 10)  # 10KB
 
 # -----------------------------
-# Payload Size Limit
+# Security Headers (outside the size limit so 413s carry them too)
 # -----------------------------
-@app.middleware("http")
-async def limit_body_size(request: Request, call_next):
-    max_size = 1024 * 10  # 10KB
-    body = await request.body()
-
-    if len(body) > max_size:
-        raise HTTPException(status_code=413, detail="Payload too large")
-
-    return await call_next(request)
+app.add_middleware(SecurityHeadersMiddleware)
 
 # -----------------------------
 # Audit Middleware
 # -----------------------------
-@app.middleware("http")
-async def audit_middleware(request: Request, call_next):
+AUDIT_TRAIL_LEVEL = os.getenv("AUDIT_TRAIL_LEVEL", "admin")  # "admin" | "off"
 
-    response = await call_next(request)
+audit_buffer = WriteBuffer(
+    AuditLog,
+    max_batch=int(os.getenv("AUDIT_BUFFER_MAX", 500)),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", 5)),
+    prepare=resolve_user_agents,  # user_agent string -> user_agents.id
+)
 
-    # Log only admin endpoints
-    if request.url.path.startswith("/admin"):
 
-        db = SessionLocal()
-        try:
-            ip = request.client.host if request.client else "unknown"
-            user_agent = request.headers.get("user-agent", "unknown")
+# Issued refresh tokens (jti only), kept for audit; validity lives in
+# the refresh token store, not in this table.
+refresh_token_buffer = WriteBuffer(
+    RefreshToken,
+    max_batch=int(os.getenv("AUDIT_BUFFER_MAX", 500)),
+    flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", 5)),
+)
 
-            db.add(AuditLog(
-                user="unknown",  # can upgrade to real user later
-                action="ADMIN_ACCESS",
-                endpoint=request.url.path,  # cleaner than full URL
-                ip_address=ip,
-                user_agent=user_agent
-            ))
 
-            db.commit()
+# Analyzed messages; stamped at request time like the audit rows (the
+# column default would record flush time)
+case_buffer = WriteBuffer(
+    Case,
+    max_batch=int(os.getenv("CASE_BUFFER_MAX", 500)),
+    flush_interval=float(os.getenv("CASE_FLUSH_INTERVAL", 2)),
+)
 
-        finally:
-            db.close()
 
-    return response
+@app.on_event("startup")
+async def start_audit_buffer():
+    audit_buffer.start()
+    refresh_token_buffer.start()
+    case_buffer.start()
 
-# -----------------------------
-# Create Tables
-# -----------------------------
-Base.metadata.create_all(bind=engine)
 
-system = CyberbullyingSystem()
+@app.on_event("shutdown")
+async def stop_audit_buffer():
+    await audit_buffer.stop()
+    await refresh_token_buffer.stop()
+    await case_buffer.stop()
+
+
+@app.middleware("http")
+async def audit_middleware(request: Request, call_next):
+
+    response = await call_next(request)
+
+    # Log only admin endpoints; rows are batched, not committed per request
+    if AUDIT_TRAIL_LEVEL == "admin" and request.url.path.startswith("/admin"):
+
+        ip = request.client.host if request.client else "unknown"
+        user_agent = request.headers.get("user-agent", "unknown")
+
+        audit_buffer.put({
+            "user": "unknown",  # can upgrade to real user later
+            "action": "ADMIN_ACCESS",
+            "endpoint": request.url.path,  # cleaner than full URL
+            "ip_address": ip,
+            "user_agent": user_agent,
+            # Request time, not flush time (up to AUDIT_FLUSH_INTERVAL later)
+            "timestamp": datetime.now(timezone.utc),
+        })
+
+    return response
 
 # -----------------------------
 # Database Dependency
@@ -192,7 +255,7 @@ def root():
 def register(request: Request, username: str, password: str, db: Session = Depends(get_db)):
 
     if not username.endswith("@gmail.com"):
-        logger.warning(f"Invalid registration attempt: {username}")
+        logger.warning("Invalid registration attempt: %s", username)
         raise HTTPException(status_code=400, detail="Only Gmail accounts allowed")
 
     strength, feedback = check_password_strength(password)
@@ -223,38 +286,55 @@ def register(request: Request, username: str, password: str, db: Session = Depen
 # -----------------------------
 # Login
 # -----------------------------
-@app.post("/login")
+@app.post("/login", response_model=LoginResponse)
 @limiter.limit("5/minute")
 def login(request: Request, username: str, password: str, db: Session = Depends(get_db)):
 
-    user = db.query(User).filter(User.username == username).first()
+    user = get_user_cached(username, db)
 
     if not user:
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
     if not verify_password(password, user.password):
-        user.failed_attempts += 1
-        if user.failed_attempts >= 5:
-            user.lockout_until = datetime.utcnow() + timedelta(minutes=15)
-            user.failed_attempts = 0
+        # One atomic UPDATE: the counter and the lockout decision are
+        # computed by the database, so concurrent attempts can't race
+        locks = User.failed_attempts + 1 >= 5
+        db.execute(
+            update(User)
+            .where(User.username == username)
+            .values(
+                failed_attempts=case((locks, 0), else_=User.failed_attempts + 1),
+                lockout_until=case(
+                    (locks, datetime.utcnow() + timedelta(minutes=15)),
+                    else_=User.lockout_until
+                )
+            )
+        )
         db.commit()
+        invalidate_user_cache(username)
         raise HTTPException(status_code=400, detail="Invalid credentials")
 
-    user.failed_attempts = 0
-    user.lockout_until = None
-    db.commit()
+    # Only write when there is something to reset or a hash to upgrade
+    changes = {}
+    if user.failed_attempts or user.lockout_until is not None:
+        changes[User.failed_attempts] = 0
+        changes[User.lockout_until] = None
+    if needs_rehash(user.password):
+        changes[User.password] = hash_password(password)
 
-    access_token = create_access_token({"sub": username})
-    refresh_token, expiry = create_refresh_token(username)
+    if changes:
+        db.query(User).filter(User.username == username).update(changes)
+        db.commit()
+        invalidate_user_cache(username)
 
-    db_refresh = RefreshToken(
-        token=refresh_token,
-        user_id=username,
-        expires_at=expiry
-    )
+    access_token = create_access_token({"sub": username})
+    refresh_token, jti, expiry = create_refresh_token(username, user.id)
 
-    db.add(db_refresh)
-    db.commit()
+    refresh_token_buffer.put({
+        "token": jti,
+        "user_id": user.id,
+        "expires_at": expiry
+    })
 
     return {
         "access_token": access_token,
@@ -266,73 +346,168 @@ def login(request: Request, username: str, password: str, db: Session = Depends(
 # -----------------------------
 # Refresh Token
 # -----------------------------
-@app.post("/refresh")
-def refresh(refresh_token: str, db: Session = Depends(get_db)):
+@app.post("/refresh", response_model=RefreshResponse)
+def refresh(refresh_token: str):
 
-    stored = db.query(RefreshToken).filter(
-        RefreshToken.token == refresh_token,
-        RefreshToken.revoked == False
-    ).first()
+    consumed = consume_refresh_token(refresh_token)
 
-    if not stored or stored.expires_at < datetime.utcnow():
+    if consumed is None:
         raise HTTPException(status_code=401, detail="Invalid refresh token")
 
-    new_access = create_access_token({"sub": stored.user_id})
-    return {"access_token": new_access}
+    username, user_id = consumed
+
+    if user_id is None:
+        with SessionLocal() as db:
+            user = get_user_cached(username, db)
+        if not user:
+            raise HTTPException(status_code=401, detail="Invalid refresh token")
+        user_id = user.id
+
+    # Rotate: the presented token is spent, hand out a fresh one
+    new_access = create_access_token({"sub": username})
+    new_refresh, jti, expiry = create_refresh_token(username, user_id)
+
+    refresh_token_buffer.put({
+        "token": jti,
+        "user_id": user_id,
+        "expires_at": expiry
+    })
+
+    return {"access_token": new_access, "refresh_token": new_refresh}
 
 # -----------------------------
 # Analyze
 # -----------------------------
-@app.post("/analyze")
+@app.post("/analyze", response_model=MessageResponse)
 @limiter.limit("10/minute")
 def analyze(request: Request,
             message: MessageRequest,
+            background_tasks: BackgroundTasks,
             current_user: str = Depends(get_current_user),
-            db: Session = Depends(get_db)):
+            db: Session = Depends(get_db),
+            system: CyberbullyingSystem = Depends(get_system)):
 
-    result = system.analyze_message(message.text, current_user, db)
+    result = system.analyze_message(message.text, current_user, db, background_tasks)
 
-    case = Case(
-        user_id=current_user,
-        text=message.text,
-        severity=result["risk_level"]
-    )
-
-    db.add(case)
-    db.commit()
+    # Batched with other requests' cases: no COMMIT on the request path
+    case_buffer.put({
+        "user_id": current_user,
+        "text": message.text,
+        "severity": result["risk_level"],
+        "timestamp": datetime.now(timezone.utc)
+    })
 
     return result
 
 # -----------------------------
 # Admin Routes
 # -----------------------------
-@app.get("/admin/users")
-def get_all_users(db: Session = Depends(get_db),
-                  current_user: User = Depends(get_current_admin)):
-    return db.query(User).all()
-
-@app.get("/admin/offenses")
-def get_all_offenses(db: Session = Depends(get_db),
-                     admin: User = Depends(get_current_admin)):
-    return db.query(Offense).all()
-
-@app.get("/admin/cases")
-def get_all_cases(db: Session = Depends(get_db),
-                  admin: User = Depends(get_current_admin)):
-    return db.query(Case).all()
-
-@app.get("/admin/summary")
-def admin_summary(db: Session = Depends(get_db),
-                  admin: User = Depends(get_current_admin)):
+# Handlers are async: only the query itself is pushed to the threadpool,
+# so a worker thread is held for the database I/O and nothing else.
+ADMIN_PAGE_MAX = 1000
+
+
+def paginated(query, id_column, after_id: int, limit: int):
+    # Keyset pagination: WHERE id > :after_id ORDER BY id LIMIT :limit walks
+    # the primary key index, so every page costs the same however deep it is.
+    limit = max(1, min(limit, ADMIN_PAGE_MAX))
+    rows = query.filter(id_column > after_id).order_by(id_column).limit(limit).all()
+    items = [row._asdict() for row in rows]
+    next_id = items[-1]["id"] if len(items) == limit else None
+    return {"items": items, "next": next_id}
+
+
+@app.get("/admin/users", response_model=UserPage)
+async def get_all_users(after_id: int = 0,
+                        limit: int = 200,
+                        db: Session = Depends(get_db),
+                        current_user: User = Depends(get_current_admin)):
+    # Password hashes are never selected
+    query = db.query(
+        User.id,
+        User.username,
+        User.is_admin,
+        User.failed_attempts,
+        User.lockout_until,
+        User.warning_count,
+        User.ban_until
+    )
+    return await run_in_threadpool(paginated, query, User.id, after_id, limit)
+
+@app.get("/admin/offenses", response_model=OffensePage)
+async def get_all_offenses(after_id: int = 0,
+                           limit: int = 200,
+                           db: Session = Depends(get_db),
+                           admin: User = Depends(get_current_admin)):
+    query = db.query(
+        Offense.id,
+        Offense.user_id,
+        Offense.count,
+        Offense.last_offense,
+        Offense.severity_score,
+        Offense.lockout_until
+    )
+    return await run_in_threadpool(paginated, query, Offense.id, after_id, limit)
+
+@app.get("/admin/cases", response_model=CasePage)
+async def get_all_cases(after_id: int = 0,
+                        limit: int = 200,
+                        db: Session = Depends(get_db),
+                        admin: User = Depends(get_current_admin)):
+    query = db.query(
+        Case.id,
+        Case.user_id,
+        Case.text,
+        Case.severity,
+        Case.timestamp
+    )
+    return await run_in_threadpool(paginated, query, Case.id, after_id, limit)
+
+@app.get("/admin/summary", response_model=SummaryResponse)
+async def admin_summary(db: Session = Depends(get_db),
+                        admin: User = Depends(get_current_admin)):
+
+    # One round-trip: four scalar subqueries in a single SELECT
+    # (lockout_until is naive UTC, as written by /login)
+    query = db.query(
+        db.query(func.count(User.id)).scalar_subquery(),
+        db.query(func.count(Case.id)).scalar_subquery(),
+        db.query(func.count(Offense.id)).scalar_subquery(),
+        db.query(func.count(User.id))
+        .filter(User.lockout_until > datetime.utcnow())
+        .scalar_subquery()
+    )
+    total_users, total_cases, total_offenses, active_lockouts = await run_in_threadpool(query.one)
 
     return {
-        "total_users": db.query(func.count(User.id)).scalar(),
-        "total_cases": db.query(func.count(Case.id)).scalar(),
-        "total_offenses": db.query(func.count(Offense.id)).scalar()
+        "total_users": total_users,
+        "total_cases": total_cases,
+        "total_offenses": total_offenses,
+        "active_lockouts": active_lockouts
     }
 
-@app.get("/admin/audit-logs")
-def get_audit_logs(db: Session = Depends(get_db),
-                   admin: User = Depends(get_current_admin)):
+def stream_audit_logs():
+    # Own session: the generator runs while the response is being sent
+    db = SessionLocal()
+    try:
+        query = db.query(
+            AuditLog.id,
+            AuditLog.user,
+            AuditLog.action,
+            AuditLog.endpoint,
+            AuditLog.ip_address,
+            UserAgent.value.label("user_agent"),
+            AuditLog.timestamp
+        ).outerjoin(UserAgent, AuditLog.user_agent_id == UserAgent.id).order_by(AuditLog.id.desc())
+
+        for row in query.yield_per(1000):
+            yield orjson.dumps(row._asdict()) + b"\n"
+    finally:
+        db.close()
 
-    return db.query(AuditLog).order_by(AuditLog.timestamp.desc()).all()
\ No newline at end of file
+
+@app.get("/admin/audit-logs")
+async def get_audit_logs(admin: User = Depends(get_current_admin)):
+    # Newest first, one JSON object per line, fetched 1000 rows at a time;
+    # Starlette iterates the sync generator in the threadpool
+    return StreamingResponse(stream_audit_logs(), media_type="application/x-ndjson")
@@ -1,5 +1,12 @@
+import asyncio
+import gzip
+import hashlib
 import os
-import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import orjson
 
 HF_API_TOKEN = os.getenv("HF_API_TOKEN")
 
@@ -9,6 +16,41 @@ headers = {
     "Authorization": f"Bearer {HF_API_TOKEN}"
 }
 
+# Pooled keep-alive connections: no TCP/TLS handshake per call.
+# httpx already asks for gzip responses (Accept-Encoding).
+ML_TIMEOUT = httpx.Timeout(float(os.getenv("ML_TIMEOUT", 8)), connect=2.0)
+ML_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+# Batches in flight together (ML_MAX_IN_FLIGHT) share one TLS connection
+# instead of one connection each (needs httpx[http2])
+ML_HTTP2 = os.getenv("ML_HTTP2") == "1"
+
+# Micro-batching: concurrent messages arriving within the window share one call
+ML_BATCH_SIZE = int(os.getenv("ML_BATCH_SIZE", 16))
+ML_BATCH_WINDOW = float(os.getenv("ML_BATCH_WINDOW_MS", 20)) / 1000
+# Batches sent at once; a slow call doesn't hold up the ones behind it
+ML_MAX_IN_FLIGHT = ML_LIMITS.max_connections
+
+# Request bodies larger than this are sent gzip-compressed
+ML_GZIP_MIN_BYTES = 2048
+
+# Shorter (stripped) texts are not sent to the model
+ML_MIN_LENGTH = 3
+
+# Longest wait for the API's "model is loading" (503) estimate
+ML_LOADING_WAIT_MAX = 5
+
+# Results for recently seen texts (retries, bot traffic, common phrases)
+ML_CACHE_SIZE = int(os.getenv("ML_CACHE_SIZE", 10_000))
+
+# In-process model instead of the HTTP API (needs transformers + torch)
+USE_LOCAL_MODEL = os.getenv("USE_LOCAL_MODEL") == "1"
+LOCAL_MODEL_NAME = os.getenv("LOCAL_MODEL_NAME", "unitary/toxic-bert")
+ML_DEVICE = int(os.getenv("ML_DEVICE", -1))  # -1 = CPU, 0 = first GPU
+
+# int8 ONNX export of the model (see app/quantize_model.py); needs optimum
+LOCAL_MODEL_ONNX_DIR = os.getenv("LOCAL_MODEL_ONNX_DIR")
+LOCAL_MODEL_ONNX_FILE = os.getenv("LOCAL_MODEL_ONNX_FILE", "model.int8.onnx")
+
 
 CATEGORY_WEIGHTS = {
     "threat": 3,
@@ -20,16 +62,7 @@ CATEGORY_WEIGHTS = {
 }
 
 
-def analyze_ml(text: str):
-
-    payload = {"inputs": text}
-
-    response = requests.post(API_URL, headers=headers, json=payload)
-
-    if response.status_code != 200:
-        return 0, {}, "UNKNOWN"
-
-    results = response.json()[0]
+def _score(results):
 
     weighted_score = 0
     category_breakdown = {}
@@ -46,4 +79,299 @@ def analyze_ml(text: str):
     # Simple sentiment fallback logic
     sentiment_label = "NEGATIVE" if weighted_score > 1 else "POSITIVE"
 
-    return weighted_score, category_breakdown, sentiment_label
\ No newline at end of file
+    return weighted_score, category_breakdown, sentiment_label
+
+
+# -----------------------------
+# Local Model
+# -----------------------------
+class LocalToxicBert:
+    def __init__(self, model_name=LOCAL_MODEL_NAME, device=ML_DEVICE, onnx_dir=LOCAL_MODEL_ONNX_DIR):
+        # Imported here: transformers is only required with USE_LOCAL_MODEL=1
+        from transformers import pipeline
+
+        if onnx_dir:
+            model, tokenizer = self._load_onnx(onnx_dir, device)
+            self.pipeline = pipeline(
+                "text-classification",
+                model=model,
+                tokenizer=tokenizer,
+                top_k=None,
+            )
+        else:
+            self.pipeline = pipeline(
+                "text-classification",
+                model=model_name,
+                top_k=None,
+                device=device,
+            )
+
+    @staticmethod
+    def _load_onnx(onnx_dir, device):
+        # Dynamically quantized int8 weights on ONNX Runtime
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        from transformers import AutoTokenizer
+
+        provider = "CUDAExecutionProvider" if device >= 0 else "CPUExecutionProvider"
+        model = ORTModelForSequenceClassification.from_pretrained(
+            onnx_dir,
+            file_name=LOCAL_MODEL_ONNX_FILE,
+            provider=provider,
+        )
+        return model, AutoTokenizer.from_pretrained(onnx_dir)
+
+    def __call__(self, texts):
+        # Same shape as the API response: one label list per input
+        return self.pipeline(texts, batch_size=ML_BATCH_SIZE, truncation=True)
+
+
+_local_model = None
+
+# One inference at a time, off the event loop; the model batches internally
+_model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="toxic-bert")
+
+
+async def load_local_model():
+    global _local_model
+
+    if USE_LOCAL_MODEL and _local_model is None:
+        loop = asyncio.get_running_loop()
+        _local_model = await loop.run_in_executor(_model_executor, LocalToxicBert)
+
+
+# -----------------------------
+# HTTP Client
+# -----------------------------
+_client = None
+
+
+def start_ml_client():
+    global _client
+
+    _client = httpx.AsyncClient(
+        headers=headers, timeout=ML_TIMEOUT, limits=ML_LIMITS, http2=ML_HTTP2
+    )
+
+
+async def close_ml_client():
+    global _client
+
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def unscored_result():
+    # What a text the model never saw (too short, skipped, call failed)
+    # scores as, here and in hybrid_detect; a fresh dict per caller
+    return 0, {}, "UNKNOWN"
+
+
+async def analyze_ml_batch(texts: list[str]):
+    # One call for all texts; texts too short to classify are answered
+    # here and never sent
+
+    results = [unscored_result() for _ in texts]
+    pending = [i for i, text in enumerate(texts) if len(text.strip()) >= ML_MIN_LENGTH]
+
+    if pending:
+        scored = await _infer([texts[i] for i in pending])
+        for i, result in zip(pending, scored):
+            results[i] = result
+
+    return results
+
+
+def _encode_payload(payload):
+    content = orjson.dumps(payload)
+    request_headers = {"Content-Type": "application/json"}
+
+    if len(content) > ML_GZIP_MIN_BYTES:
+        content = gzip.compress(content)
+        request_headers["Content-Encoding"] = "gzip"
+
+    return content, request_headers
+
+
+async def _infer(texts: list[str]):
+
+    if USE_LOCAL_MODEL:
+        await load_local_model()
+        loop = asyncio.get_running_loop()
+        batch_results = await loop.run_in_executor(_model_executor, _local_model, texts)
+        return [_score(results) for results in batch_results]
+
+    if _client is None:
+        start_ml_client()
+
+    unknown = [unscored_result() for _ in texts]
+    content, request_headers = _encode_payload({"inputs": texts})
+
+    # Timeouts and connection failures are answered like a non-200
+    try:
+        response = await _client.post(API_URL, content=content, headers=request_headers)
+
+        if response.status_code == 503:
+            # Model still loading: wait as advised (capped) and retry once
+            try:
+                wait = float(orjson.loads(response.content).get("estimated_time", 1))
+            except (ValueError, AttributeError, TypeError):
+                wait = 1
+            await asyncio.sleep(min(wait, ML_LOADING_WAIT_MAX))
+            response = await _client.post(API_URL, content=content, headers=request_headers)
+    except httpx.HTTPError:
+        return unknown
+
+    if response.status_code != 200:
+        return unknown
+
+    try:
+        batch_results = orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        return unknown
+
+    if not isinstance(batch_results, list):
+        return unknown
+
+    # A single input may come back unwrapped: [{label, score}, ...]
+    if len(texts) == 1 and batch_results and isinstance(batch_results[0], dict):
+        batch_results = [batch_results]
+
+    if len(batch_results) != len(texts):
+        return unknown
+
+    return [_score(results) for results in batch_results]
+
+
+async def analyze_ml(text: str):
+    return (await analyze_ml_batch([text]))[0]
+
+
+# -----------------------------
+# Micro-Batching Queue
+# -----------------------------
+_queue = None
+_worker = None
+_in_flight = set()
+
+
+def start_ml_batcher():
+    global _queue, _worker
+
+    _queue = asyncio.Queue()
+    _worker = asyncio.get_running_loop().create_task(_batch_worker(_queue))
+
+
+async def stop_ml_batcher():
+    global _queue, _worker
+
+    if _worker is None:
+        return
+
+    _worker.cancel()
+    for task in _in_flight:
+        task.cancel()
+    await asyncio.gather(_worker, *_in_flight, return_exceptions=True)
+
+    # Nobody will call the model for what is still queued; answer it as
+    # unscored, like batches cut off above
+    while not _queue.empty():
+        _, future = _queue.get_nowait()
+        if not future.done():
+            future.set_result(unscored_result())
+
+    _queue = _worker = None
+
+
+# -----------------------------
+# Result Cache (LRU)
+# -----------------------------
+# Only touched from the event loop thread, with no await between lookup and
+# update, so it needs no lock. toxic-bert is uncased: case and surrounding
+# whitespace don't change its output, so they don't split the key.
+_ml_cache = OrderedDict()
+
+
+def _cache_key(text: str):
+    return hashlib.blake2b(text.strip().lower().encode(), digest_size=16).digest()
+
+
+async def batched_analyze_ml(text: str):
+    key = _cache_key(text)
+
+    cached = _ml_cache.get(key)
+    if cached is not None:
+        _ml_cache.move_to_end(key)
+        return cached
+
+    # Started with the app; started here too for callers outside it
+    if _worker is None or _worker.done():
+        start_ml_batcher()
+
+    future = asyncio.get_running_loop().create_future()
+    await _queue.put((text, future))
+    result = await future
+
+    # Failed calls come back as UNKNOWN; let the next request retry them
+    if result[2] != "UNKNOWN":
+        _ml_cache[key] = result
+        if len(_ml_cache) > ML_CACHE_SIZE:
+            _ml_cache.popitem(last=False)
+
+    return result
+
+
+async def _batch_worker(queue: asyncio.Queue):
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(ML_MAX_IN_FLIGHT)
+
+    while True:
+        batch = []
+        try:
+            batch.append(await queue.get())
+            deadline = loop.time() + ML_BATCH_WINDOW
+
+            while len(batch) < ML_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await slots.acquire()
+        except asyncio.CancelledError:
+            # Stopped while collecting or waiting for a slot: answer these
+            # callers as unscored rather than leave them waiting
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(unscored_result())
+            raise
+
+        # Send it off and go straight back to collecting the next one
+        task = loop.create_task(_run_batch(batch))
+        _in_flight.add(task)
+        task.add_done_callback(_in_flight.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+
+async def _run_batch(batch):
+    texts = [text for text, _ in batch]
+
+    try:
+        results = await analyze_ml_batch(texts)
+    except asyncio.CancelledError:
+        for _, future in batch:
+            if not future.done():
+                future.set_result(unscored_result())
+        raise
+    except Exception as exc:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(exc)
+        return
+
+    for (_, future), result in zip(batch, results):
+        if not future.done():
+            future.set_result(result)
\ No newline at end of file
@@ -1,7 +1,6 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index
+from sqlalchemy.sql import func, false, text
 from .database import Base
-from datetime import datetime
 
 class User(Base):
     __tablename__ = "users"
@@ -9,10 +8,10 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True)
     password = Column(String)
-    is_admin = Column(Boolean, default=False)
-    failed_attempts = Column(Integer, default=0)
+    is_admin = Column(Boolean, server_default=false())
+    failed_attempts = Column(Integer, server_default=text("0"))
     lockout_until = Column(DateTime, nullable=True)
-    warning_count = Column(Integer, default=0)
+    warning_count = Column(Integer, server_default=text("0"))
     ban_until = Column(DateTime, nullable=True)
 
 class RefreshToken(Base):
@@ -20,9 +19,9 @@ class RefreshToken(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     token = Column(String, nullable=False, unique=True)
-    user_id = Column(String, ForeignKey("users.username"))
-    expires_at = Column(DateTime)
-    revoked = Column(Boolean, default=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    revoked = Column(Boolean, server_default=false())
     
 
 class Case(Base):
@@ -34,26 +33,37 @@ class Case(Base):
     severity = Column(String)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
+    # A user's cases, newest first
+    __table_args__ = (
+        Index("ix_case_user_ts", user_id, timestamp.desc()),
+    )
+
 class Offense(Base):
     __tablename__ = "offenses"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String, unique=True, index=True)
-    count = Column(Integer, default=0)
+    count = Column(Integer, server_default=text("0"))
     last_offense = Column(DateTime(timezone=True), server_default=func.now())
-    severity_score = Column(Integer, default=0)
+    severity_score = Column(Integer, server_default=text("0"))
     lockout_until = Column(DateTime(timezone=True), nullable=True)
 
+class UserAgent(Base):
+    __tablename__ = "user_agents"
+
+    id = Column(Integer, primary_key=True, index=True)
+    value = Column(String, unique=True, index=True, nullable=False)
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
     id = Column(Integer, primary_key=True, index=True)
 
-    user = Column(String, nullable=True)  # username
+    user = Column(String, nullable=True, index=True)  # username
     action = Column(String, nullable=False)
     endpoint = Column(String, nullable=False)
 
-    ip_address = Column(String, nullable=False)  # ✅ IP stored here
-    user_agent = Column(String, nullable=True)   # optional but powerful
+    ip_address = Column(String, nullable=False, index=True)  # ✅ IP stored here
+    user_agent_id = Column(Integer, ForeignKey("user_agents.id"), nullable=True, index=True)  # optional but powerful
 
-    timestamp = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
\ No newline at end of file
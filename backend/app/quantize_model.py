@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+
+from .ml_engine import LOCAL_MODEL_NAME, LOCAL_MODEL_ONNX_FILE
+
+
+# -----------------------------
+# Export + int8 Quantization
+# -----------------------------
+# One-shot, at build time (needs optimum[onnxruntime]):
+#   python -m app.quantize_model ./tbert-onnx
+# then run with USE_LOCAL_MODEL=1 LOCAL_MODEL_ONNX_DIR=./tbert-onnx
+def quantize_model(output_dir: str, model_name: str = LOCAL_MODEL_NAME):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from optimum.onnxruntime import ORTModelForSequenceClassification
+    from transformers import AutoTokenizer
+
+    output = Path(output_dir)
+
+    model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+    model.save_pretrained(output)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(output)
+
+    # Dynamic quantization: int8 weights, activations quantized at runtime
+    quantize_dynamic(
+        str(output / "model.onnx"),
+        str(output / LOCAL_MODEL_ONNX_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+
+if __name__ == "__main__":
+    quantize_model(sys.argv[1] if len(sys.argv) > 1 else "tbert-onnx")
@@ -1,10 +1,81 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, ConfigDict
 
 class MessageRequest(BaseModel):
+    # Oversized text is rejected while parsing. Unknown fields are ignored,
+    # not forbidden: the frontend still sends a legacy user_id.
+    model_config = ConfigDict(frozen=True, str_max_length=4096)
+
     text: str
     
 
 class MessageResponse(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     risk_level: str
     score: int
-    action: str
\ No newline at end of file
+    action: str
+    matched_terms: List[Tuple[str, str]]
+
+
+class LoginResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+    token_type: str
+    is_admin: bool
+
+
+class RefreshResponse(BaseModel):
+    access_token: str
+    refresh_token: str
+
+
+class SummaryResponse(BaseModel):
+    total_users: int
+    total_cases: int
+    total_offenses: int
+    active_lockouts: int
+
+
+class UserOut(BaseModel):
+    id: int
+    username: str
+    is_admin: Optional[bool]
+    failed_attempts: Optional[int]
+    lockout_until: Optional[datetime]
+    warning_count: Optional[int]
+    ban_until: Optional[datetime]
+
+
+class OffenseOut(BaseModel):
+    id: int
+    user_id: str
+    count: Optional[int]
+    last_offense: Optional[datetime]
+    severity_score: Optional[int]
+    lockout_until: Optional[datetime]
+
+
+class CaseOut(BaseModel):
+    id: int
+    user_id: Optional[str]
+    text: Optional[str]
+    severity: Optional[str]
+    timestamp: Optional[datetime]
+
+
+class UserPage(BaseModel):
+    items: List[UserOut]
+    next: Optional[int]
+
+
+class OffensePage(BaseModel):
+    items: List[OffenseOut]
+    next: Optional[int]
+
+
+class CasePage(BaseModel):
+    items: List[CaseOut]
+    next: Optional[int]
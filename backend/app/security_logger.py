@@ -1,15 +1,52 @@
+import atexit
 import logging
 import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
 
-logging.basicConfig(
-    level=LOG_LEVEL,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler("security.log"),
-        logging.StreamHandler()
-    ]
-)
+formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
+
+# Workers started by the Procfile (uvicorn --workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+if WEB_CONCURRENCY > 1:
+    # Several processes append to one file; none of them may rotate it (the
+    # others would keep writing to the renamed file). Rotate externally
+    # (logrotate); each process reopens security.log once it has moved.
+    file_handler = WatchedFileHandler("security.log", delay=True)
+else:
+    # Single process: bounded on disk, security.log plus LOG_BACKUP_COUNT
+    # rotated files
+    file_handler = RotatingFileHandler(
+        "security.log",
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        delay=True,
+    )
+file_handler.setFormatter(formatter)
+
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+
+# Log calls on the request path only enqueue the record; the listener
+# thread does the actual file/stream writes. It starts when this module is
+# first imported and drains the queue at exit.
+root_logger = logging.getLogger()
+root_logger.setLevel(LOG_LEVEL)
+
+# Idempotent: if the module is executed again (reload), reuse the queue
+# handler already on the root logger instead of stacking a second one
+queue_handler = next((h for h in root_logger.handlers if isinstance(h, QueueHandler)), None)
+if queue_handler is None:
+    log_queue = queue.SimpleQueue()
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    log_listener = QueueListener(log_queue, file_handler, stream_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
 
 logger = logging.getLogger("security")
\ No newline at end of file
@@ -0,0 +1,36 @@
+import threading
+
+from cachetools import TTLCache
+
+
+# -----------------------------
+# Refresh Token Store
+# -----------------------------
+# Holds the jti of every refresh token that is still valid. Redis when a
+# URL is given, so rotations and revocations are seen by every worker;
+# otherwise an in-process TTLCache, which is only correct for a single
+# worker (same trade-off as the rate limiter's memory:// fallback).
+class RefreshTokenStore:
+    def __init__(self, redis_url=None, ttl=7 * 24 * 3600, maxsize=100_000):
+        self.ttl = ttl
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url)
+        else:
+            self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+            self._lock = threading.Lock()
+
+    def add(self, jti):
+        if self._redis is not None:
+            self._redis.setex(f"rt:{jti}", self.ttl, "1")
+            return
+        with self._lock:
+            self._local[jti] = True
+
+    def consume(self, jti):
+        # Atomic check-and-remove: a token can be rotated exactly once
+        if self._redis is not None:
+            return self._redis.delete(f"rt:{jti}") == 1
+        with self._lock:
+            return self._local.pop(jti, None) is not None
@@ -0,0 +1,74 @@
+import threading
+
+from cachetools import LRUCache
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from .models import UserAgent
+
+
+# -----------------------------
+# User-Agent Dictionary
+# -----------------------------
+# Audit rows store user_agents.id instead of the full header. The few
+# distinct values seen by a process are kept here so a flush usually
+# needs no lookup at all.
+_ua_ids = LRUCache(maxsize=1024)
+_ua_lock = threading.Lock()
+
+
+def _insert_ignoring_duplicates(db: Session, values):
+    # Another worker may insert the same value first; let the unique
+    # index decide and read the winning ids back afterwards
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        db.execute(insert(UserAgent), [{"value": value} for value in values])
+        return
+
+    db.execute(
+        dialect_insert(UserAgent).on_conflict_do_nothing(index_elements=["value"]),
+        [{"value": value} for value in values],
+    )
+
+
+def get_user_agent_ids(db: Session, values):
+    ids = {}
+    missing = set()
+
+    with _ua_lock:
+        for value in values:
+            ua_id = _ua_ids.get(value)
+            if ua_id is None:
+                missing.add(value)
+            else:
+                ids[value] = ua_id
+
+    if missing:
+        query = select(UserAgent.value, UserAgent.id).where(UserAgent.value.in_(missing))
+        found = dict(db.execute(query).all())
+
+        new = missing - found.keys()
+        if new:
+            _insert_ignoring_duplicates(db, new)
+            found.update(db.execute(select(UserAgent.value, UserAgent.id).where(UserAgent.value.in_(new))).all())
+
+        with _ua_lock:
+            _ua_ids.update(found)
+        ids.update(found)
+
+    return ids
+
+
+def resolve_user_agents(db: Session, rows):
+    # WriteBuffer hook: swap each row's "user_agent" string for its id
+    ids = get_user_agent_ids(db, {row["user_agent"] for row in rows if row.get("user_agent")})
+
+    for row in rows:
+        value = row.pop("user_agent", None)
+        row["user_agent_id"] = ids.get(value)
+
+    return rows
@@ -0,0 +1,184 @@
+import asyncio
+import io
+
+from .database import SessionLocal
+from .security_logger import logger
+
+
+def _csv_field(value):
+    # Every value quoted, NULL left bare: in COPY's CSV format only an
+    # unquoted empty field is NULL, so '' and None stay distinct
+    if value is None:
+        return ""
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+# Queued by stop(): the flush loop writes what it has collected and exits
+_STOP = object()
+
+
+# -----------------------------
+# Buffered Bulk Writer
+# -----------------------------
+# Rows (plain dicts for `model`) are queued in memory and flushed by a
+# background task once max_batch rows are waiting or flush_interval
+# seconds have passed: one bulk INSERT + commit per batch (a streamed COPY
+# on PostgreSQL).
+class WriteBuffer:
+    def __init__(self, model, max_batch=500, flush_interval=5.0, maxsize=10_000, prepare=None):
+        self.model = model
+        # Optional prepare(db, rows) -> rows, run in the flush session first
+        self.prepare = prepare
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = self._loop.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+
+        # Not cancelled: the rows the loop is holding in its current batch
+        # would go with it
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+        # Drain whatever arrived after the loop's last batch
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await asyncio.to_thread(self._write, batch)
+        self._report_dropped()
+
+    def put(self, row: dict):
+        if self._task is None:
+            # Not running under the app lifecycle; write through
+            self._write([row])
+            return
+
+        # asyncio.Queue is not thread-safe: rows from sync handlers (run on
+        # the threadpool) are handed to the loop instead of queued directly
+        try:
+            on_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            on_loop = False
+
+        if on_loop:
+            self._enqueue(row)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, row)
+
+    def _enqueue(self, row):
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: shed the row rather than block the request
+            self.dropped += 1
+
+    def _report_dropped(self):
+        if self.dropped:
+            logger.warning("Dropped %d %s rows (buffer full)", self.dropped, self.model.__tablename__)
+            self.dropped = 0
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+
+        stopping = False
+
+        while not stopping:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+
+            batch = [row]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            await asyncio.to_thread(self._write, batch)
+            self._report_dropped()
+
+    def _write(self, batch):
+        db = SessionLocal()
+        try:
+            if self.prepare is not None:
+                batch = self.prepare(db, batch)
+
+            copy = None
+            dialect = db.get_bind().dialect
+            if dialect.name == "postgresql":
+                copy = self._copy_statement(batch, dialect)
+
+            if copy is not None:
+                self._copy(db, *copy)
+            else:
+                db.bulk_insert_mappings(self.model, batch)
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            logger.error("Failed to flush %d %s rows: %s", len(batch), self.model.__tablename__, exc)
+        finally:
+            db.close()
+
+    def _copy_statement(self, batch, dialect):
+        # COPY ... FROM STDIN (CSV) for the batch, or None when a missing
+        # column has a Python-side callable default that COPY can't apply
+        table = self.model.__table__
+        columns = list(batch[0])
+
+        defaults = {}
+        for column in table.columns:
+            if column.key in batch[0] or column.default is None:
+                continue
+            if not column.default.is_scalar:
+                return None
+            defaults[column.key] = column.default.arg
+
+        columns += list(defaults)
+
+        data = io.StringIO()
+        for row in batch:
+            data.write(",".join(
+                _csv_field(row.get(column, defaults.get(column))) for column in columns
+            ))
+            data.write("\n")
+
+        preparer = dialect.identifier_preparer
+        sql = "COPY {} ({}) FROM STDIN WITH (FORMAT csv)".format(
+            preparer.format_table(table),
+            ", ".join(preparer.quote(table.c[column].name) for column in columns),
+        )
+        return sql, data.getvalue()
+
+    @staticmethod
+    def _copy(db, sql, data):
+        cursor = db.connection().connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):  # psycopg2
+                cursor.copy_expert(sql, io.StringIO(data))
+            else:  # psycopg 3
+                with cursor.copy(sql) as copy:
+                    copy.write(data)
+        finally:
+            cursor.close()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+# A throwaway SQLite file: the flush runs in a worker thread, so an
+# in-memory database (one per connection) would not see the tables
+_db_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_db_dir, "test.db")
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import Case  # noqa: E402
+from app.write_buffer import WriteBuffer  # noqa: E402
+
+
+def _row(i):
+    return {"user_id": f"user{i}", "text": "message", "severity": "mild"}
+
+
+class WriteBufferStopTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        Base.metadata.create_all(bind=engine)
+
+    def tearDown(self):
+        with SessionLocal() as db:
+            db.query(Case).delete()
+            db.commit()
+
+    def _count(self):
+        with SessionLocal() as db:
+            return db.query(Case).count()
+
+    def test_stop_before_flush_interval_writes_collected_rows(self):
+        async def run():
+            buffer = WriteBuffer(Case, max_batch=100, flush_interval=60)
+            buffer.start()
+            for i in range(3):
+                buffer.put(_row(i))
+            await asyncio.sleep(0.1)
+            await asyncio.wait_for(buffer.stop(), timeout=10)
+
+        asyncio.run(run())
+        self.assertEqual(self._count(), 3)
+
+    def test_stop_writes_rows_put_from_other_threads(self):
+        async def run():
+            buffer = WriteBuffer(Case, max_batch=100, flush_interval=60)
+            buffer.start()
+            await asyncio.gather(*(asyncio.to_thread(buffer.put, _row(i)) for i in range(5)))
+            await asyncio.wait_for(buffer.stop(), timeout=10)
+
+        asyncio.run(run())
+        self.assertEqual(self._count(), 5)
+
+    def test_stop_waits_for_write_in_progress(self):
+        async def run():
+            buffer = WriteBuffer(Case, max_batch=2, flush_interval=60)
+            buffer.start()
+            for i in range(3):
+                buffer.put(_row(i))
+            await asyncio.sleep(0)
+            await asyncio.wait_for(buffer.stop(), timeout=10)
+
+        asyncio.run(run())
+        self.assertEqual(self._count(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()